@@ -2,17 +2,30 @@
 ## IMPORTS ##
 #############
 import asyncio
+import functools
+import hashlib
 import logging
 import os
+import random
+import re
+import sqlite3
 import time
-from typing import Any, Dict
-from typing import List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict
+from typing import List, Optional, Tuple
 from agno.agent import Agent
 from agno.models.groq import Groq
 from agno.storage.sqlite import SqliteStorage
 from agno.tools import tool
 from dotenv import load_dotenv
-import requests
+import httpx
+import orjson
+
+try:
+    import uvloop
+except ImportError:  # uvloop doesn't support Windows
+    uvloop = None
 
 #########
 ## ENV ##
@@ -25,6 +38,31 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 POTPIE_API_KEY = os.getenv("POTPIE_API_KEY")
 agent_storage: str = ".temp/agents.db"
+REPO_NAME_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]*/\.?[A-Za-z0-9][A-Za-z0-9_.-]*")
+POTPIE_CACHE_TTL = float(os.getenv("POTPIE_CACHE_TTL", "3600"))
+POTPIE_CACHE_MAX_AGE = float(os.getenv("POTPIE_CACHE_MAX_AGE", "86400"))
+POTPIE_MAX_CONCURRENCY = int(os.getenv("POTPIE_MAX_CONCURRENCY", "8"))
+
+ANALYSIS_QUERY = (
+    "Provide a detailed analysis of this repository including: "
+    "current number of stars, current number of forks, typical commit frequency (e.g., High, Medium, Low), "
+    "estimated average issue response time, assessment of documentation quality (e.g., score 1-10 or description), "
+    "overall code quality assessment (e.g., Excellent, Good, Fair), community engagement level (e.g., Very Active, Active, Low), "
+    "and maintenance status (e.g., Well Maintained, Needs Attention)."
+)
+TRENDS_QUERY = (
+    "Provide recent trending metrics for this repository including: "
+    "star growth rate (e.g., percentage increase over the last month), "
+    "fork growth rate (e.g., percentage increase over the last month), "
+    "new contributor growth (e.g., number of new contributors in the last month), "
+    "and the recent commit frequency trend (e.g., Increasing, Stable, Decreasing)."
+)
+COMBINED_QUERY = (
+    "Answer both of the following requests about this repository.\n"
+    f"1. {ANALYSIS_QUERY}\n"
+    f"2. {TRENDS_QUERY}\n"
+    'Return as JSON with keys: "analysis" (the answer to 1) and "trends" (the answer to 2).'
+)
 
 
 ###################
@@ -32,70 +70,496 @@ agent_storage: str = ".temp/agents.db"
 ###################
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - [potpie-api] - %(levelname)s - %(message)s')
 
+class PotpieCache:
+    """
+    Persistent cache of parse results and query responses, kept alongside the agent storage in SQLite.
+    Entries younger than `ttl` are fresh; entries up to `max_age` old are served as stale (callers refresh them in the background).
+    Every entry is keyed by a fingerprint of the API key, so switching Potpie accounts never serves another account's projects.
+    """
+
+    def __init__(self, db_file: str, api_key: str, ttl: float = 3600, max_age: float = 86400, max_workers: int = 4):
+        self.db_file = db_file
+        self.account = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        self.ttl = ttl
+        self.max_age = max(ttl, max_age)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="potpie-cache")
+        self._schema_ready = False
+
+    async def aclose(self) -> None:
+        """Shut down the cache's executor, letting pending writes finish off the event loop."""
+        await asyncio.to_thread(self._executor.shutdown)
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run blocking SQLite work on the cache's own executor rather than the loop's default one.
+
+        The cache is best-effort: SQLite errors (e.g. the database being locked) are logged and treated as a miss.
+        """
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args))
+        except sqlite3.Error as e:
+            logging.warning("Potpie cache unavailable, continuing without it: %s", e)
+            return None
+
+    def _ensure_schema(self, conn: sqlite3.Connection) -> None:
+        """Create the cache tables on first use; runs on the executor so the event loop never touches the disk."""
+        if self._schema_ready:
+            return
+        with conn:
+            for table in ("potpie_parse_cache", "potpie_query_cache"):
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if columns and "account" not in columns:
+                    # Tables from before entries were keyed by account; it's only a cache, so start over.
+                    conn.execute(f"DROP TABLE {table}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS potpie_parse_cache ("
+                "account TEXT NOT NULL, repo TEXT NOT NULL, branch TEXT NOT NULL, project_id TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (account, repo, branch))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS potpie_query_cache ("
+                "account TEXT NOT NULL, project_id TEXT NOT NULL, query_sha256 TEXT NOT NULL, response_json TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (account, project_id, query_sha256))"
+            )
+        self._schema_ready = True
+
+    def _execute(self, sql: str, params: Tuple[Any, ...] = ()) -> Optional[Tuple[Any, ...]]:
+        if not self._schema_ready:
+            os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_file)
+        try:
+            self._ensure_schema(conn)
+            with conn:
+                return conn.execute(sql, params).fetchone()
+        finally:
+            conn.close()
+
+    def _lookup(self, sql: str, params: Tuple[Any, ...]) -> Optional[Tuple[Any, bool]]:
+        row = self._execute(sql, params)
+        if row is None:
+            return None
+        value, created_at = row
+        age = time.time() - created_at
+        if age > self.max_age:
+            return None
+        return value, age > self.ttl
+
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+    async def get_project_id(self, repo_name: str, branch_name: str) -> Optional[Tuple[str, bool]]:
+        """Return `(project_id, is_stale)` for a previously parsed repo/branch, if cached."""
+        return await self._run(
+            self._lookup,
+            "SELECT project_id, created_at FROM potpie_parse_cache WHERE account = ? AND repo = ? AND branch = ?",
+            (self.account, repo_name, branch_name),
+        )
+
+    async def set_project_id(self, repo_name: str, branch_name: str, project_id: str) -> None:
+        await self._run(
+            self._execute,
+            "INSERT OR REPLACE INTO potpie_parse_cache (account, repo, branch, project_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            (self.account, repo_name, branch_name, project_id, time.time()),
+        )
+
+    async def delete_project_id(self, repo_name: str, branch_name: str, project_id: str) -> None:
+        """Forget a project that turned out to be unusable, along with any answers cached for it."""
+        await self._run(
+            self._execute,
+            "DELETE FROM potpie_parse_cache WHERE account = ? AND repo = ? AND branch = ? AND project_id = ?",
+            (self.account, repo_name, branch_name, project_id),
+        )
+        await self._run(
+            self._execute,
+            "DELETE FROM potpie_query_cache WHERE account = ? AND project_id = ?",
+            (self.account, project_id),
+        )
+
+    async def get_response(self, project_id: str, query: str) -> Optional[Tuple[Any, bool]]:
+        """Return `(response, is_stale)` for a query previously asked of a project, if cached."""
+        hit = await self._run(
+            self._lookup,
+            "SELECT response_json, created_at FROM potpie_query_cache WHERE account = ? AND project_id = ? AND query_sha256 = ?",
+            (self.account, project_id, self._query_key(query)),
+        )
+        if hit is None:
+            return None
+        response_json, stale = hit
+        return orjson.loads(response_json), stale
+
+    async def set_response(self, project_id: str, query: str, response: Any) -> None:
+        await self._run(
+            self._execute,
+            "INSERT OR REPLACE INTO potpie_query_cache (account, project_id, query_sha256, response_json, created_at) VALUES (?, ?, ?, ?, ?)",
+            (self.account, project_id, self._query_key(query), orjson.dumps(response).decode(), time.time()),
+        )
+
+
 class Potpie:
     BASE_URL = "https://production-api.potpie.ai/api/v2"
-
-    def __init__(self, api_key: str):
+    TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+    LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=10)
+    LONG_POLL_WAIT = 30
+    LONG_POLL_CONCURRENCY = 4
+    PARSE_MEMO_TTL = 60
+    MAX_CONVERSATIONS = 256
+
+    def __init__(self, api_key: str, cache: Optional[PotpieCache] = None, max_concurrency: int = 8):
         self.api_key = api_key
+        self.cache = cache
+        self._sem = asyncio.Semaphore(max_concurrency)
+        # Long-polls can be held open for LONG_POLL_WAIT seconds, so they get their own slots instead of starving other calls.
+        self._long_poll_sem = asyncio.Semaphore(self.LONG_POLL_CONCURRENCY)
         self.headers = {
             "x-api-key": self.api_key,
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            "Accept-Encoding": "br, gzip"
         }
-
-    def _make_request(self, method: str, endpoint: str, json_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        url = f"{self.BASE_URL}{endpoint}"
-        logging.info(f"Making {method} request to {url} with data: {json_data}")
+        self._client = httpx.AsyncClient(
+            base_url=self.BASE_URL,
+            headers=self.headers,
+            timeout=self.TIMEOUT,
+            limits=self.LIMITS,
+            http2=True,
+        )
+        self._status_cache: Dict[str, Tuple[Dict[str, str], Dict[str, Any]]] = {}
+        self._parse_cache: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._ready_waiters: Dict[str, asyncio.Task] = {}
+        self._long_poll_supported: Optional[bool] = None
+        self._refreshes: Dict[Tuple[str, ...], asyncio.Task] = {}
+        self._project_sources: Dict[str, Tuple[str, str]] = {}
+        self._conversations: Dict[Tuple[str, str], str] = {}
+        self._conversation_locks: OrderedDict[Tuple[str, str], asyncio.Lock] = OrderedDict()
+
+    async def aclose(self) -> None:
+        """Cancel in-flight background work (refreshes, shared parses and readiness polls), then close the HTTP client and the cache."""
+        tasks = [*self._refreshes.values(), *self._parse_cache.values(), *self._ready_waiters.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._client.aclose()
+        if self.cache is not None:
+            await self.cache.aclose()
+
+    def _spawn_refresh(self, key: Tuple[str, ...], refresh: Callable[[], Awaitable[Any]]) -> None:
+        """Run a cache refresh in the background, unless one for the same key is already in flight."""
+        if key in self._refreshes:
+            return
+        task = asyncio.ensure_future(refresh())
+        self._refreshes[key] = task
+        task.add_done_callback(lambda t: self._on_refresh_done(key, t))
+
+    def _on_refresh_done(self, key: Tuple[str, ...], task: asyncio.Task) -> None:
+        if self._refreshes.get(key) is task:
+            del self._refreshes[key]
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Background cache refresh failed: %s", task.exception())
+
+    async def _make_request(self, method: str, endpoint: str, json_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        logging.info("Making %s request to %s%s", method, self.BASE_URL, endpoint)
+        logging.debug("Request body: %s", json_data)
         try:
-            response = requests.request(method, url, headers=self.headers, json=json_data)
+            content = orjson.dumps(json_data) if json_data is not None else None
+            async with self._sem:
+                response = await self._client.request(method, endpoint, content=content)
             response.raise_for_status()
-            result = response.json()
-            logging.info(f"Received response: {result}")
+            result = orjson.loads(response.content)
+            logging.debug("Received response: %s", result)
             return result
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Request failed: {e}")
+        except httpx.HTTPError as e:
+            logging.error("Request failed: %s", e)
             raise
 
-    def parse_repository(self, repo_name: str, branch_name: str) -> Dict[str, Any]:
-        """Initiate parsing for a given repository and branch."""
+    async def _fetch_status(self, project_id: str, wait: Optional[float] = None) -> Dict[str, Any]:
+        """GET the parsing status, revalidating against the last response so unchanged polls come back as a 304.
+
+        If `wait` is given, asks the server to hold the request for up to that many seconds until the status changes.
+        """
+        endpoint = f"/parsing-status/{project_id}"
+        cached = self._status_cache.get(project_id)
+        headers = cached[0] if cached else None
+        params = None
+        timeout = self.TIMEOUT
+        sem = self._sem
+        if wait is not None:
+            params = {"wait": "true", "timeout": int(wait)}
+            timeout = httpx.Timeout(wait + 5, connect=10.0)
+            sem = self._long_poll_sem
+        logging.info("Making GET request to %s%s (conditional: %s, wait: %s)", self.BASE_URL, endpoint, bool(headers), wait)
+        try:
+            async with sem:
+                response = await self._client.get(endpoint, headers=headers, params=params, timeout=timeout)
+            if response.status_code == 304 and cached:
+                logging.info("Parsing status for %s unchanged (304), reusing cached response", project_id)
+                return cached[1]
+            response.raise_for_status()
+            result = orjson.loads(response.content)
+        except httpx.HTTPError as e:
+            logging.error("Request failed: %s", e)
+            raise
+        logging.debug("Received response: %s", result)
+
+        validators = {}
+        if etag := response.headers.get("etag"):
+            validators["If-None-Match"] = etag
+        if last_modified := response.headers.get("last-modified"):
+            validators["If-Modified-Since"] = last_modified
+        if validators:
+            self._status_cache[project_id] = (validators, result)
+        else:
+            self._status_cache.pop(project_id, None)
+        return result
+
+    async def parse_repository(self, repo_name: str, branch_name: str) -> Dict[str, Any]:
+        """Initiate parsing for a given repository and branch.
+
+        Concurrent callers share the in-flight request per (repo, branch), and its result is reused for
+        PARSE_MEMO_TTL seconds; longer-lived reuse is left to the persistent cache.
+        """
+        key = (repo_name, branch_name)
+        task = self._parse_cache.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._cached_parse(repo_name, branch_name))
+            task.add_done_callback(lambda t: self._on_parse_done(key, t))
+            self._parse_cache[key] = task
+        else:
+            logging.info("Reusing parse request for %s@%s", repo_name, branch_name)
+        return await asyncio.shield(task)
+
+    async def _cached_parse(self, repo_name: str, branch_name: str) -> Dict[str, Any]:
+        if self.cache is not None:
+            hit = await self.cache.get_project_id(repo_name, branch_name)
+            if hit is not None:
+                project_id, stale = hit
+                logging.info("Using cached project %s for %s@%s (stale: %s)", project_id, repo_name, branch_name, stale)
+                if stale:
+                    self._spawn_refresh(("parse", repo_name, branch_name), lambda: self._request_parse(repo_name, branch_name))
+                self._project_sources[project_id] = (repo_name, branch_name)
+                return {"project_id": project_id}
+        return await self._request_parse(repo_name, branch_name)
+
+    async def _request_parse(self, repo_name: str, branch_name: str) -> Dict[str, Any]:
         endpoint = "/parse"
         payload = {"repo_name": repo_name, "branch_name": branch_name}
-        return self._make_request("POST", endpoint, json_data=payload)
+        result = await self._make_request("POST", endpoint, json_data=payload)
+        if isinstance(result, dict) and result.get("project_id"):
+            self._project_sources[result["project_id"]] = (repo_name, branch_name)
+            if self.cache is not None:
+                await self.cache.set_project_id(repo_name, branch_name, result["project_id"])
+        return result
+
+    async def _forget_project(self, project_id: str) -> None:
+        """Drop a project that failed from the parse memo and the persistent cache, so the next parse starts afresh."""
+        source = self._project_sources.pop(project_id, None)
+        if source is None:
+            return
+        logging.info("Project %s for %s@%s is unusable, dropping it from the cache", project_id, *source)
+        self._parse_cache.pop(source, None)
+        if self.cache is not None:
+            await self.cache.delete_project_id(*source, project_id)
+
+    def _on_parse_done(self, key: Tuple[str, str], task: asyncio.Task) -> None:
+        """Drop a parse that errored or returned no project_id right away, and a successful one after PARSE_MEMO_TTL."""
+        if task.cancelled() or task.exception() is not None or "project_id" not in task.result():
+            self._forget_parse(key, task)
+        else:
+            asyncio.get_running_loop().call_later(self.PARSE_MEMO_TTL, self._forget_parse, key, task)
 
-    def get_parsing_status(self, project_id: str, wait_for_ready: bool = True, timeout: int = 300, poll_interval: int = 10) -> Dict[str, Any]:
-        """Get the parsing status for a project, optionally waiting until it's ready."""
-        endpoint = f"/parsing-status/{project_id}"
-        start_time = time.time()
+    def _forget_parse(self, key: Tuple[str, str], task: asyncio.Task) -> None:
+        if self._parse_cache.get(key) is task:
+            del self._parse_cache[key]
+
+    async def get_parsing_status(self, project_id: str, wait_for_ready: bool = True, timeout: int = 300, backoff_base: float = 1.0, backoff_cap: float = 15.0) -> Dict[str, Any]:
+        """Get the parsing status for a project, optionally waiting until it's ready.
+
+        Concurrent waiters on the same project share a single poll loop.
+        """
+        if not wait_for_ready:
+            return await self._fetch_status(project_id)
+
+        task = self._ready_waiters.get(project_id)
+        if task is None:
+            task = asyncio.ensure_future(self._poll_until_ready(project_id, timeout, backoff_base, backoff_cap))
+            task.add_done_callback(lambda t: self._forget_ready_waiter(project_id, t))
+            self._ready_waiters[project_id] = task
+        else:
+            logging.info("Joining in-flight readiness poll for project %s", project_id)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except TimeoutError:
+            raise TimeoutError(f"Project {project_id} did not become ready within {timeout} seconds.")
+
+    async def _poll_until_ready(self, project_id: str, timeout: int, backoff_base: float, backoff_cap: float) -> Dict[str, Any]:
+        """Poll the parsing status, backing off exponentially (with jitter) from `backoff_base` up to `backoff_cap` seconds.
+
+        Long-polls that the server actually held are re-issued straight away; any reply that comes back early still waits out the backoff.
+        """
+        start_time = time.monotonic()
+        attempt = 0
         while True:
-            status_data = self._make_request("GET", endpoint)
-            if not wait_for_ready or status_data.get("status") == "ready":
+            try:
+                if self._long_poll_supported is not False:
+                    remaining = timeout - (time.monotonic() - start_time)
+                    status_data, held = await self._long_poll_status(project_id, max(1, min(self.LONG_POLL_WAIT, remaining)))
+                else:
+                    status_data, held = await self._fetch_status(project_id), False
+            except httpx.HTTPStatusError as e:
+                if e.response.is_client_error:
+                    await self._forget_project(project_id)
+                raise
+            if status_data.get("status") == "ready":
                 return status_data
-            if time.time() - start_time > timeout:
-                logging.error(f"Timeout waiting for project {project_id} to become ready.")
+            if status_data.get("status") == "error":
+                logging.error("Parsing failed for project %s.", project_id)
+                await self._forget_project(project_id)
+                raise RuntimeError(f"Parsing failed for project {project_id}.")
+            elapsed = time.monotonic() - start_time
+            if elapsed > timeout:
+                logging.error("Timeout waiting for project %s to become ready.", project_id)
                 raise TimeoutError(f"Project {project_id} did not become ready within {timeout} seconds.")
-            logging.info(f"Project {project_id} status is {status_data.get('status')}. Waiting...")
-            time.sleep(poll_interval)
+            if held:
+                continue
+            delay = min(backoff_cap, backoff_base * (2 ** attempt))
+            delay += random.uniform(0, 0.25 * delay)
+            attempt += 1
+            logging.info("Project %s status is %s. Retrying in %.1fs...", project_id, status_data.get('status'), delay)
+            await asyncio.sleep(delay)
+
+    async def _long_poll_status(self, project_id: str, wait: float) -> Tuple[Dict[str, Any], bool]:
+        """Fetch the parsing status as a long-poll, returning it with whether the server held the request.
+
+        A server that rejects the parameters or answers a non-ready status early is treated as not supporting
+        long-polling. Support is re-checked on every early answer, so one slow reply can't mark it supported for good.
+        """
+        started = time.monotonic()
+        try:
+            status_data = await self._fetch_status(project_id, wait=wait)
+        except httpx.HTTPStatusError as e:
+            if self._long_poll_supported is not None or not e.response.is_client_error:
+                raise
+            # Only blame the wait parameters if the same request without them works; a bad project_id or
+            # API key fails both ways and must not switch long-polling off for everyone else.
+            status_data = await self._fetch_status(project_id)
+            logging.info("Long-polling parsing status not supported (%s), falling back to polling", e.response.status_code)
+            self._long_poll_supported = False
+            return status_data, False
+        if status_data.get("status") == "ready":
+            return status_data, False
+        held = time.monotonic() - started >= wait / 2
+        if held:
+            self._long_poll_supported = True
+        elif self._long_poll_supported:
+            # Could be a genuine status transition; decide again on the next reply.
+            self._long_poll_supported = None
+        else:
+            logging.info("Long-polling parsing status not supported (server did not hold the request), falling back to polling")
+            self._long_poll_supported = False
+        return status_data, held
+
+    def _forget_ready_waiter(self, project_id: str, task: asyncio.Task) -> None:
+        if self._ready_waiters.get(project_id) is task:
+            del self._ready_waiters[project_id]
 
-    def create_conversation(self, project_ids: List[str], agent_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    async def create_conversation(self, project_ids: List[str], agent_ids: Optional[List[str]] = None) -> Dict[str, Any]:
         """Create a new conversation."""
         endpoint = "/conversations"
         payload = {"project_ids": project_ids}
         if agent_ids:
             payload["agent_ids"] = agent_ids
-        return self._make_request("POST", endpoint, json_data=payload)
+        return await self._make_request("POST", endpoint, json_data=payload)
 
-    def send_message(self, conversation_id: str, content: str, agent_id: Optional[str] = None, node_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    async def send_message(self, conversation_id: str, content: str, agent_id: Optional[str] = None, node_ids: Optional[List[str]] = None) -> Dict[str, Any]:
         """Send a message within a conversation."""
         endpoint = f"/conversations/{conversation_id}/message"
         payload = {
             "content": content,
             "agent_id": agent_id,
-            "node_ids": node_ids if node_ids is not None else []
+            "node_ids": node_ids if node_ids is not None else ()
         }
-        return self._make_request("POST", endpoint, json_data=payload)
+        return await self._make_request("POST", endpoint, json_data=payload)
+
+    async def ask(self, project_id: str, query: str, timeout: int = 600, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Ask a question about a parsed project once it's ready.
+
+        Without a `session_id` the question is asked in a fresh conversation and repeats are served from the cache.
+        With one, it goes to that session's own conversation for the project, so follow-ups keep their context;
+        those answers depend on the conversation so they bypass the cache.
+        """
+        if session_id is not None:
+            await self.get_parsing_status(project_id, wait_for_ready=True, timeout=timeout)
+            return await self._ask_in_session(project_id, query, session_id)
+        if self.cache is not None:
+            hit = await self.cache.get_response(project_id, query)
+            if hit is not None:
+                response, stale = hit
+                logging.info("Using cached response for query on %s (stale: %s)", project_id, stale)
+                if stale:
+                    self._spawn_refresh(("ask", project_id, query), lambda: self._ask(project_id, query, timeout))
+                return response
+        return await self._ask(project_id, query, timeout)
+
+    async def _ask(self, project_id: str, query: str, timeout: int) -> Dict[str, Any]:
+        await self.get_parsing_status(project_id, wait_for_ready=True, timeout=timeout)
+        conversation_id = await self._new_conversation(project_id)
+        response = await self.send_message(conversation_id=conversation_id, content=query)
+        if self.cache is not None:
+            await self.cache.set_response(project_id, query, response)
+        return response
+
+    async def _ask_in_session(self, project_id: str, query: str, session_id: str) -> Dict[str, Any]:
+        """Send a query in the session's conversation for a project, one message at a time."""
+        key = (session_id, project_id)
+        async with self._conversation_lock(key):
+            conversation_id = self._conversations.get(key)
+            if conversation_id is None:
+                conversation_id = self._conversations[key] = await self._new_conversation(project_id)
+            else:
+                logging.info("Reusing conversation %s for project %s", conversation_id, project_id)
+            try:
+                return await self.send_message(conversation_id=conversation_id, content=query)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in (404, 410):
+                    raise
+                logging.info("Conversation %s for project %s is gone (%s), starting a new one", conversation_id, project_id, e.response.status_code)
+                del self._conversations[key]
+                conversation_id = self._conversations[key] = await self._new_conversation(project_id)
+                return await self.send_message(conversation_id=conversation_id, content=query)
+
+    def _conversation_lock(self, key: Tuple[str, str]) -> asyncio.Lock:
+        """Return the lock for a session's conversation, evicting the least recently used idle ones past MAX_CONVERSATIONS."""
+        lock = self._conversation_locks.get(key)
+        if lock is None:
+            lock = self._conversation_locks[key] = asyncio.Lock()
+        self._conversation_locks.move_to_end(key)
+        while len(self._conversation_locks) > self.MAX_CONVERSATIONS:
+            oldest, oldest_lock = next(iter(self._conversation_locks.items()))
+            if oldest_lock.locked():
+                break
+            del self._conversation_locks[oldest]
+            self._conversations.pop(oldest, None)
+        return lock
+
+    async def _new_conversation(self, project_id: str) -> str:
+        conversation_data = await self.create_conversation(project_ids=[project_id])
+        conversation_id = conversation_data.get("conversation_id")
+        if not conversation_id:
+            raise RuntimeError("Failed to create Potpie conversation.")
+        logging.info("Created conversation %s for project %s", conversation_id, project_id)
+        return conversation_id
+
 
+@functools.lru_cache(maxsize=1)
+def get_potpie() -> Potpie:
+    """Return the shared Potpie client, creating it (and its cache) on first use."""
+    cache = PotpieCache(agent_storage, api_key=POTPIE_API_KEY or "", ttl=POTPIE_CACHE_TTL, max_age=POTPIE_CACHE_MAX_AGE) if POTPIE_CACHE_TTL > 0 else None
+    return Potpie(api_key=POTPIE_API_KEY, cache=cache, max_concurrency=POTPIE_MAX_CONCURRENCY)
 
-# Initialize Potpie client
-potpie_client = Potpie(api_key=POTPIE_API_KEY)
+
+async def close_potpie() -> None:
+    """Close the shared Potpie client if it was ever created; the next get_potpie() builds a fresh one."""
+    if get_potpie.cache_info().currsize:
+        await get_potpie().aclose()
+        get_potpie.cache_clear()
 
 
 #################
@@ -110,25 +574,26 @@ async def start_repo_parsing(repo_name: str, branch_name: str = "main") -> str:
     Example repo_name: 'owner/repo'
     """
     try:
-        if not repo_name or '/' not in repo_name:
+        if not REPO_NAME_RE.fullmatch(repo_name or ""):
             return "Invalid repository name format. Expected format: 'owner/repo'"
             
-        logging.info(f"Starting parsing for {repo_name} on branch {branch_name}")
-        result = await asyncio.to_thread(potpie_client.parse_repository, repo_name=repo_name, branch_name=branch_name)
+        logging.info("Starting parsing for %s on branch %s", repo_name, branch_name)
+        result = await get_potpie().parse_repository(repo_name=repo_name, branch_name=branch_name)
         
         if isinstance(result, dict) and 'project_id' in result:
             project_id = result['project_id']
-            logging.info(f"Parsing initiated successfully: {result}")
+            logging.info("Parsing initiated successfully for %s, project_id: %s", repo_name, project_id)
+            logging.debug("Parse response: %s", result)
             return f"Successfully started parsing repository {repo_name}\nProject ID: {project_id}\nStatus: Parsing initiated"
         else:
-            logging.error(f"Invalid response format from Potpie API: {result}")
+            logging.error("Invalid response format from Potpie API: %s", result)
             return f"Failed to parse repository: Invalid API response format"
             
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Network error during repo parsing for {repo_name}: {e}")
+    except httpx.HTTPError as e:
+        logging.error("Network error during repo parsing for %s: %s", repo_name, e)
         return f"Failed to parse repository: Network error - {str(e)}"
     except Exception as e:
-        logging.error(f"Unexpected error during repo parsing for {repo_name}: {e}")
+        logging.error("Unexpected error during repo parsing for %s: %s", repo_name, e)
         return f"Failed to parse repository: {str(e)}"
 
 @tool(show_result=True)
@@ -140,58 +605,49 @@ async def check_repo_parsing_status(project_id: str) -> str:
         if not project_id:
             return "Invalid project_id: Project ID cannot be empty"
             
-        logging.info(f"Checking parsing status for project_id: {project_id}")
-        status = await asyncio.to_thread(potpie_client.get_parsing_status, project_id, wait_for_ready=False)
+        logging.info("Checking parsing status for project_id: %s", project_id)
+        status = await get_potpie().get_parsing_status(project_id, wait_for_ready=False)
         
         if isinstance(status, dict):
             status_value = status.get('status')
             if status_value:
-                logging.info(f"Parsing status for {project_id}: {status}")
+                logging.info("Parsing status for %s: %s", project_id, status_value)
                 return f"Current parsing status: {status_value}"
             else:
-                logging.error(f"Invalid status response format: {status}")
+                logging.error("Invalid status response format: %s", status)
                 return "Failed to get parsing status: Invalid response format"
         else:
-            logging.error(f"Invalid response type from Potpie API: {type(status)}")
+            logging.error("Invalid response type from Potpie API: %s", type(status))
             return "Failed to get parsing status: Invalid API response type"
             
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Network error checking parsing status for {project_id}: {e}")
+    except httpx.HTTPError as e:
+        logging.error("Network error checking parsing status for %s: %s", project_id, e)
         return f"Failed to get parsing status: Network error - {str(e)}"
     except Exception as e:
-        logging.error(f"Unexpected error checking parsing status for {project_id}: {e}")
+        logging.error("Unexpected error checking parsing status for %s: %s", project_id, e)
         return f"Failed to get parsing status: {str(e)}"
 
 
 @tool(show_result=True)
-async def ask_parsed_repo(project_id: str, query: str) -> str:
+async def ask_parsed_repo(agent: Agent, project_id: str, query: str) -> str:
     """
     Asks a question about a repository that has already been parsed by Potpie,
     identified by its project_id. Waits for parsing to complete if not already ready.
+    Follow-up questions in the same chat session keep the earlier context.
     """
     try:
-        logging.info(f"Querying project_id: {project_id} with query: '{query}'")
-        parsing_status = await asyncio.to_thread(potpie_client.get_parsing_status, project_id, wait_for_ready=True, timeout=600)
-        if parsing_status.get("status") != "ready":
-            return f"Project {project_id} is not ready for querying. Status: {parsing_status.get('status')}"
-
-        conversation_data = await asyncio.to_thread(potpie_client.create_conversation, project_ids=[project_id])
-        conversation_id = conversation_data.get("conversation_id")
-        if not conversation_id:
-            return "Failed to create Potpie conversation."
-
-        logging.info(f"Created conversation {conversation_id} for project {project_id}")
-
-        message_response = await asyncio.to_thread(potpie_client.send_message, conversation_id=conversation_id, content=query)
-        logging.info(f"Received response for query on {project_id}: {message_response}")
+        logging.info("Querying project_id: %s with query: '%s'", project_id, query)
+        message_response = await get_potpie().ask(project_id, query, session_id=agent.session_id)
+        logging.info("Received response for query on %s", project_id)
+        logging.debug("Query response for %s: %s", project_id, message_response)
 
         return str(message_response)
 
     except TimeoutError as e:
-        logging.error(f"Timeout waiting for project {project_id} to be ready: {e}")
+        logging.error("Timeout waiting for project %s to be ready: %s", project_id, e)
         return f"Timeout waiting for repository parsing to complete: {str(e)}"
     except Exception as e:
-        logging.error(f"Error querying parsed repo {project_id}: {e}")
+        logging.error("Error querying parsed repo %s: %s", project_id, e)
         return f"Failed to query repository: {str(e)}"
 
 
@@ -202,34 +658,28 @@ async def analyze_repository(repo_name: str) -> str:
     Expects repo_name like 'owner/repo'. This tool handles parsing initiation and querying.
     """
     try:
-        logging.info(f"analyze_repository: Starting parsing for {repo_name}")
-        parse_result = await asyncio.to_thread(potpie_client.parse_repository, repo_name=repo_name, branch_name="main")
+        if not REPO_NAME_RE.fullmatch(repo_name or ""):
+            return "Invalid repository name format. Expected format: 'owner/repo'"
+
+        logging.info("analyze_repository: Starting parsing for %s", repo_name)
+        parse_result = await get_potpie().parse_repository(repo_name=repo_name, branch_name="main")
         project_id = parse_result.get("project_id")
         if not project_id:
             return f"Failed to get project_id when starting parsing for {repo_name}. Response: {parse_result}"
-        logging.info(f"analyze_repository: Parsing started for {repo_name}, project_id: {project_id}. Waiting for completion...")
-
-        analysis_query = (
-            "Provide a detailed analysis of this repository including: "
-            "current number of stars, current number of forks, typical commit frequency (e.g., High, Medium, Low), "
-            "estimated average issue response time, assessment of documentation quality (e.g., score 1-10 or description), "
-            "overall code quality assessment (e.g., Excellent, Good, Fair), community engagement level (e.g., Very Active, Active, Low), "
-            "and maintenance status (e.g., Well Maintained, Needs Attention)."
-        )
-        logging.info(f"analyze_repository: Querying project {project_id} for analysis.")
-        analysis_response = await ask_parsed_repo(project_id=project_id, query=analysis_query)
-        logging.info(f"analyze_repository: Received analysis response for {project_id}: {analysis_response}")
+        logging.info("analyze_repository: Parsing started for %s, project_id: %s. Waiting for completion...", repo_name, project_id)
 
-        if analysis_response.startswith("Failed"):
-            return analysis_response
-        else:
-            return f"Analysis of repository {repo_name}: {analysis_response}"
+        logging.info("analyze_repository: Querying project %s for analysis.", project_id)
+        analysis_response = await get_potpie().ask(project_id, ANALYSIS_QUERY)
+        logging.info("analyze_repository: Received analysis response for %s", project_id)
+        logging.debug("analyze_repository: Analysis response for %s: %s", project_id, analysis_response)
+
+        return f"Analysis of repository {repo_name}: {analysis_response}"
 
     except TimeoutError as e:
-        logging.error(f"Timeout during analysis for {repo_name}: {e}")
+        logging.error("Timeout during analysis for %s: %s", repo_name, e)
         return f"Timeout waiting for repository parsing/analysis: {str(e)}"
     except Exception as e:
-        logging.error(f"Error during repository analysis for {repo_name}: {e}")
+        logging.error("Error during repository analysis for %s: %s", repo_name, e)
         return f"Failed to analyze repository: {str(e)}"
 
 
@@ -240,23 +690,20 @@ async def get_repository_trends(repo_name: str) -> str:
     Expects repo_name like 'owner/repo'. This tool handles parsing initiation and querying.
     """
     try:
-        logging.info(f"get_repository_trends: Starting parsing for {repo_name}")
-        parse_result = await asyncio.to_thread(potpie_client.parse_repository, repo_name=repo_name, branch_name="main")
+        if not REPO_NAME_RE.fullmatch(repo_name or ""):
+            return "Invalid repository name format. Expected format: 'owner/repo'"
+
+        logging.info("get_repository_trends: Starting parsing for %s", repo_name)
+        parse_result = await get_potpie().parse_repository(repo_name=repo_name, branch_name="main")
         project_id = parse_result.get("project_id")
         if not project_id:
             return f"Failed to get project_id when starting parsing for {repo_name}. Response: {parse_result}"
-        logging.info(f"get_repository_trends: Parsing started for {repo_name}, project_id: {project_id}. Waiting for completion...")
-
-        trends_query = (
-            "Provide recent trending metrics for this repository including: "
-            "star growth rate (e.g., percentage increase over the last month), "
-            "fork growth rate (e.g., percentage increase over the last month), "
-            "new contributor growth (e.g., number of new contributors in the last month), "
-            "and the recent commit frequency trend (e.g., Increasing, Stable, Decreasing)."
-        )
-        logging.info(f"get_repository_trends: Querying project {project_id} for trends.")
-        trends_response = await ask_parsed_repo(project_id=project_id, query=trends_query)
-        logging.info(f"get_repository_trends: Received trends response for {project_id}: {trends_response}")
+        logging.info("get_repository_trends: Parsing started for %s, project_id: %s. Waiting for completion...", repo_name, project_id)
+
+        logging.info("get_repository_trends: Querying project %s for trends.", project_id)
+        trends_response = await get_potpie().ask(project_id, TRENDS_QUERY)
+        logging.info("get_repository_trends: Received trends response for %s", project_id)
+        logging.debug("get_repository_trends: Trends response for %s: %s", project_id, trends_response)
 
         if isinstance(trends_response, dict) and "error" in trends_response:
              return f"Potpie query failed for trends: {trends_response['error']}"
@@ -266,13 +713,71 @@ async def get_repository_trends(repo_name: str) -> str:
              return f"Potpie trends raw response for {repo_name}: {trends_response}"
 
     except TimeoutError as e:
-        logging.error(f"Timeout during trend analysis for {repo_name}: {e}")
+        logging.error("Timeout during trend analysis for %s: %s", repo_name, e)
         return f"Timeout waiting for repository parsing/trends: {str(e)}"
     except Exception as e:
-        logging.error(f"Error during repository trend analysis for {repo_name}: {e}")
+        logging.error("Error during repository trend analysis for %s: %s", repo_name, e)
         return f"Failed to get repository trends: {str(e)}"
 
 
+def _split_combined_response(response: Any) -> Optional[Tuple[Any, Any]]:
+    """Extract the `analysis` and `trends` sections from a COMBINED_QUERY answer, or None if it isn't the JSON asked for."""
+    text = response
+    if isinstance(response, dict):
+        text = response.get("message") or response.get("response") or ""
+    if not isinstance(text, str):
+        return None
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = orjson.loads(text[start:end + 1])
+    except orjson.JSONDecodeError:
+        return None
+    if not isinstance(data, dict) or "analysis" not in data or "trends" not in data:
+        return None
+    return data["analysis"], data["trends"]
+
+
+@tool(show_result=True)
+async def analyze_and_trends(repo_name: str) -> str:
+    """
+    Analyze a GitHub repository and get its trending metrics in a single pass using Potpie.
+    Parses the repository once and asks for the analysis and trends in a single query.
+    Expects repo_name like 'owner/repo'.
+    """
+    try:
+        if not REPO_NAME_RE.fullmatch(repo_name or ""):
+            return "Invalid repository name format. Expected format: 'owner/repo'"
+
+        logging.info("analyze_and_trends: Starting parsing for %s", repo_name)
+        parse_result = await get_potpie().parse_repository(repo_name=repo_name, branch_name="main")
+        project_id = parse_result.get("project_id")
+        if not project_id:
+            return f"Failed to get project_id when starting parsing for {repo_name}. Response: {parse_result}"
+        logging.info("analyze_and_trends: Parsing started for %s, project_id: %s. Waiting for completion...", repo_name, project_id)
+
+        logging.info("analyze_and_trends: Querying project %s for analysis and trends.", project_id)
+        combined_response = await get_potpie().ask(project_id, COMBINED_QUERY)
+        logging.info("analyze_and_trends: Received response for %s", project_id)
+
+        sections = _split_combined_response(combined_response)
+        if sections is None:
+            return f"Analysis and trends of repository {repo_name}: {combined_response}"
+        analysis_response, trends_response = sections
+        return (
+            f"Analysis of repository {repo_name}: {analysis_response}\n\n"
+            f"Trends of repository {repo_name}: {trends_response}"
+        )
+
+    except TimeoutError as e:
+        logging.error("Timeout during analysis and trends for %s: %s", repo_name, e)
+        return f"Timeout waiting for repository parsing/analysis: {str(e)}"
+    except Exception as e:
+        logging.error("Error during repository analysis and trends for %s: %s", repo_name, e)
+        return f"Failed to analyze repository and trends: {str(e)}"
+
+
 ################
 ## AGENT INIT ##
 ################
@@ -281,32 +786,37 @@ agent_tools = [
     check_repo_parsing_status,
     ask_parsed_repo,
     analyze_repository,
-    get_repository_trends
+    get_repository_trends,
+    analyze_and_trends
 ]
 
 if not GROQ_API_KEY or not POTPIE_API_KEY:
     print("CRITICAL: Either GROQ_API_KEY or POTPIE_API_KEY is not set in .env. Potpie-dependent tools are disabled.")
     agent_tools = []
 
+AGENT_INSTRUCTIONS = "\n".join((
+    "You are a specialized GitHub QnA agent.",
+    "You have access to tools for analyzing repositories using Potpie.",
+    "To answer questions about a specific repository's code or structure (e.g., 'What does function X do?', 'Summarize class Y', 'Find usages of Z'):",
+    "1. Use 'start_repo_parsing' with the 'owner/repo' name. Get the 'project_id'.",
+    "2. Inform the user parsing started.",
+    "3. Use 'ask_parsed_repo' with the 'project_id' and the specific query. This tool waits for parsing to finish.",
+    "To get a general analysis or metrics for a repository:",
+    "1. Use the 'analyze_repository' tool with the 'owner/repo' name. This tool handles parsing and querying Potpie for analysis data.",
+    "To get repository trends:",
+    "1. Use the 'get_repository_trends' tool with the 'owner/repo' name. This tool handles parsing and querying Potpie for trend data.",
+    "To get both an analysis and trends for the same repository:",
+    "1. Use the 'analyze_and_trends' tool with the 'owner/repo' name instead of calling the two tools separately. It parses once and fetches both with a single query.",
+    "If the Potpie client is unavailable (due to missing API key), inform the user that parsing, code questions, analysis, and trends are not possible.",
+    "Provide clear responses based *only* on the tool outputs.",
+    "If a tool returns an error, report it clearly.",
+))
+
 github_agent = Agent(
     name="GitHub QnA Agent",
     model=Groq(api_key=GROQ_API_KEY, max_retries=3),
     tools=agent_tools,
-    instructions=[
-        "You are a specialized GitHub QnA agent.",
-        "You have access to tools for analyzing repositories using Potpie.",
-        "To answer questions about a specific repository's code or structure (e.g., 'What does function X do?', 'Summarize class Y', 'Find usages of Z'):",
-        "1. Use 'start_repo_parsing' with the 'owner/repo' name. Get the 'project_id'.",
-        "2. Inform the user parsing started.",
-        "3. Use 'ask_parsed_repo' with the 'project_id' and the specific query. This tool waits for parsing to finish.",
-        "To get a general analysis or metrics for a repository:",
-        "1. Use the 'analyze_repository' tool with the 'owner/repo' name. This tool handles parsing and querying Potpie for analysis data.",
-        "To get repository trends:",
-        "1. Use the 'get_repository_trends' tool with the 'owner/repo' name. This tool handles parsing and querying Potpie for trend data.",
-        "If the Potpie client is unavailable (due to missing API key), inform the user that parsing, code questions, analysis, and trends are not possible.",
-        "Provide clear responses based *only* on the tool outputs.",
-        "If a tool returns an error, report it clearly.",
-    ],
+    instructions=AGENT_INSTRUCTIONS,
     storage=SqliteStorage(table_name="github_agent", db_file=agent_storage),
     add_datetime_to_instructions=True,
     add_history_to_messages=True,
@@ -326,7 +836,10 @@ async def main():
 
     message = input("Enter your message: ")
     print(f"--- Sending message to agent: '{message}' ---")
-    await github_agent.aprint_response(message, stream=True, show_tool_calls=True)
+    try:
+        await github_agent.aprint_response(message, stream=True, show_tool_calls=True)
+    finally:
+        await close_potpie()
 
     print("\n--- Agent finished ---")
 
@@ -335,4 +848,7 @@ async def main():
 ## RUN AGENT ##
 ###############
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -1,13 +1,14 @@
 #############
 ## IMPORTS ##
 #############
-from agent import github_agent
+from agent import close_potpie, github_agent
 from agno.playground import Playground, serve_playground_app
 
 #################
 ## APPLICATION ##
 #################
 app = Playground(agents=[github_agent]).get_app()
+app.add_event_handler("shutdown", close_potpie)
 
 ################
 ## PLAYGROUND ##